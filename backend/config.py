@@ -0,0 +1,24 @@
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable
+
+
+def _env(name: str, default: str, cast: Callable[[str], Any] = str, **kwargs: Any) -> Any:
+    return field(default_factory=lambda: cast(os.environ.get(name, default)), **kwargs)
+
+@dataclass(frozen=True)
+class Settings:
+    supabase_url: str = _env("SUPABASE_URL", "https://uvhbjitcxbnjvofoargw.supabase.co")
+    supabase_key: str = _env("SUPABASE_KEY", "sb_publishable_coxaCf9Jn1_97EU8mTsX7Q_s7bWKw5j", repr=False)
+    frontend_url: str = _env("FRONTEND_URL", "http://localhost:5173")
+    is_dev: bool = _env("ENV", "production", lambda value: value == "dev")
+    secret_key: str = _env("SECRET_KEY", "sentinel-ai-secret-key-2024", repr=False)
+    bcrypt_rounds: int = _env("BCRYPT_ROUNDS", "12", int)
+    use_re2: bool = _env("USE_RE2", "1", lambda value: value == "1")
+    max_scan_bytes: int = _env("MAX_SCAN_BYTES", str(2 * 1024 * 1024), int)
+
+@lru_cache
+def settings() -> Settings:
+    """Read the environment once per process."""
+    return Settings()
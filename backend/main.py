@@ -1,33 +1,70 @@
 import os
-import re
-import json
+import asyncio
+import logging
+import hmac
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from jose import JWTError, jwt
+import jwt
 import bcrypt
-from supabase import create_client, Client
+import httpx
+from cachetools import TTLCache
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+from config import settings
+from pii_core import calculate_risk, detect_and_redact
+
+logger = logging.getLogger(__name__)
 
 # --- Supabase Configuration ---
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://uvhbjitcxbnjvofoargw.supabase.co")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "sb_publishable_coxaCf9Jn1_97EU8mTsX7Q_s7bWKw5j")
+# Every query shares one keep-alive pool, so a TLS handshake is paid per
+# pooled connection instead of per request.
+SUPABASE_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+SUPABASE_HTTP_TIMEOUT = 10
+
+_supabase: Optional[AsyncClient] = None
+_supabase_lock = asyncio.Lock()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Async client, so handlers suspend during Supabase round trips instead of
+# blocking the loop. Created on first use so cold starts that only hit
+# /api/health skip it.
+async def get_supabase() -> AsyncClient:
+    global _supabase
+    if _supabase is None:
+        async with _supabase_lock:
+            if _supabase is None:
+                http_client = httpx.AsyncClient(limits=SUPABASE_HTTP_LIMITS, timeout=SUPABASE_HTTP_TIMEOUT)
+                _supabase = await acreate_client(
+                    settings().supabase_url,
+                    settings().supabase_key,
+                    options=AsyncClientOptions(httpx_client=http_client),
+                )
+    return _supabase
 
 # --- FastAPI App ---
-app = FastAPI(title="Sentinel AI API", version="2.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    writer = asyncio.create_task(_history_writer())
+    yield
+    # Stop the writer after the rows already queued, and wait for its last insert
+    await HISTORY_QUEUE.put(None)
+    await writer
+
+app = FastAPI(lifespan=lifespan, title="Sentinel AI API", version="2.0.0", default_response_class=ORJSONResponse)
 
 # --- CORS Configuration ---
-FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:5173")
-ALLOWED_ORIGINS = [
-    FRONTEND_URL,
-    "http://localhost:5173",
-    "http://localhost:3000",
-    "*"  # Allow all for development
-]
+FRONTEND_URL = settings().frontend_url
+ALLOWED_ORIGINS = [FRONTEND_URL]
+if settings().is_dev:
+    ALLOWED_ORIGINS += ["http://localhost:5173", "http://localhost:3000"]
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,9 +75,12 @@ app.add_middleware(
 )
 
 # --- Security Configuration ---
-SECRET_KEY = os.environ.get("SECRET_KEY", "sentinel-ai-secret-key-2024")
+SECRET_KEY = settings().secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# bcrypt work factor for new hashes; lower it (e.g. 10) on dev machines.
+# Existing hashes are upgraded on the next successful login.
+BCRYPT_ROUNDS = settings().bcrypt_rounds
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
@@ -63,42 +103,101 @@ class UserCreate(BaseModel):
 class PIIRequest(BaseModel):
     text: str
     custom_patterns: Optional[Dict[str, str]] = None
+    include_original: bool = False  # Echo the input back in the response
+    store_original: bool = False  # Keep the raw input in scan history
 
 class PIIResponse(BaseModel):
-    original_text: str
+    original_text: str = ""
     redacted_text: str
     detected_pii: List[Dict[str, Any]]
     risk_level: str
 
 # --- Utility Functions ---
-def calculate_risk(detected: List[Dict[str, str]]) -> str:
-    if not detected:
-        return "None"
-    
-    high_sensitivity = {"AADHAAR", "PAN", "PASSPORT", "CREDIT_CARD", "CVV", "ATM_PIN"}
-    medium_sensitivity = {"VOTER_ID", "GSTIN"}
-    
-    has_high = any(item['type'] in high_sensitivity for item in detected)
-    has_medium = any(item['type'] in medium_sensitivity for item in detected)
-    total_count = len(detected)
-    
-    if has_high or total_count > 5:
-        return "High"
-    if has_medium or total_count >= 3:
-        return "Medium"
-    return "Low"
+# bcrypt is CPU-bound by design: run it on one thread per core, and shed
+# load with 429 once twice that many calls are in flight instead of queueing.
+BCRYPT_WORKERS = os.cpu_count() or 1
+BCRYPT_POOL = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+BCRYPT_SEMAPHORE = asyncio.Semaphore(BCRYPT_WORKERS * 2)
+
+async def run_bcrypt(func, *args):
+    if BCRYPT_SEMAPHORE.locked():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many concurrent authentication requests",
+        )
+    async with BCRYPT_SEMAPHORE:
+        return await asyncio.get_running_loop().run_in_executor(BCRYPT_POOL, func, *args)
+
+# Successful bcrypt checks only, keyed by an HMAC so plaintext passwords are
+# never held in memory; failures always pay the full work factor.
+PASSWORD_CACHE_TTL_SECONDS = 60
+PASSWORD_CACHE_MAX_ENTRIES = 1024
+_PW_CACHE: "OrderedDict[bytes, float]" = OrderedDict()
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    key = hmac.new(
+        SECRET_KEY.encode('utf-8'),
+        plain_password.encode('utf-8') + hashed_password.encode('utf-8'),
+        'sha256'
+    ).digest()
+    now = time.monotonic()
+    verified_at = _PW_CACHE.get(key)
+    if verified_at is not None and now - verified_at < PASSWORD_CACHE_TTL_SECONDS:
+        return True
+
+    if not await run_bcrypt(bcrypt.checkpw, plain_password.encode('utf-8'), hashed_password.encode('utf-8')):
+        return False
+
+    _PW_CACHE[key] = now
+    _PW_CACHE.move_to_end(key)
+    while len(_PW_CACHE) > PASSWORD_CACHE_MAX_ENTRIES:
+        _PW_CACHE.popitem(last=False)
+    return True
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+# Login caches: user rows for 30 s, and recently failed (username, password)
+# pairs for 5 s so a retry flood skips both the database and bcrypt. Failure
+# keys are keyed BLAKE2b digests, never the credentials themselves.
+_USER_ROW_CACHE: TTLCache = TTLCache(maxsize=5000, ttl=30)
+_BAD_LOGIN_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=5)
 
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def _login_key(username: str, password: str) -> bytes:
+    return hashlib.blake2b(
+        username.encode('utf-8') + b"\0" + password.encode('utf-8'),
+        key=SECRET_KEY.encode('utf-8')[:64],
+        digest_size=16
+    ).digest()
+
+async def get_password_hash(password: str) -> str:
+    hashed = await run_bcrypt(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+def needs_rehash(hashed_password: str) -> bool:
+    # bcrypt hashes are formatted as $2b$<rounds>$<salt><digest>
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def rehash_password(user_id: str, password: str):
+    try:
+        hashed_password = await get_password_hash(password)
+    except HTTPException:
+        return  # Shed under load; retried on the next login
+    supabase = await get_supabase()
+    await supabase.table("users").update({
+        "hashed_password": hashed_password
+    }).eq("id", user_id).execute()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # `exp` is epoch seconds; computing it directly skips datetime round trips
+    lifetime = expires_delta.total_seconds() if expires_delta else 15 * 60
+    return jwt.encode({**data, "exp": int(time.time() + lifetime)}, SECRET_KEY, algorithm=ALGORITHM)
+
+# Decoded users keyed by a digest of the token (raw bearer tokens are never
+# kept). Each entry also stores the token's `exp`, which is re-checked on
+# every hit so expiry is still honored; the short TTL bounds how long a
+# rotated secret keeps accepting old tokens.
+_TOKEN_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=60)
 
 async def get_current_user(authorization: str = Header(None)):
     """Validate JWT token and return the authenticated user."""
@@ -113,85 +212,102 @@ async def get_current_user(authorization: str = Header(None)):
     
     token = authorization.replace("Bearer ", "")
     
+    cache_key = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+    cached = _TOKEN_CACHE.get(cache_key)
+    if cached is not None:
+        user, expires_at = cached
+        if time.time() < expires_at:
+            return user
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         user_id: str = payload.get("user_id")
         if username is None:
             raise credentials_exception
-        return {"id": user_id, "username": username}
-    except JWTError:
+        user = {"id": user_id, "username": username}
+        _TOKEN_CACHE[cache_key] = (user, payload.get("exp", 0))
+        return user
+    except jwt.PyJWTError:
         raise credentials_exception
 
-# --- Regex Patterns ---
-PATTERNS = {
-    # Indian Documents
-    "AADHAAR": r"\b\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b",
-    "PAN": r"\b[A-Z]{5}[0-9]{4}[A-Z]{1}\b",
-    "VOTER_ID": r"\b[A-Z]{3}[0-9]{7}\b",
-    "GSTIN": r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1}\b",
-    "PASSPORT": r"\b[A-Z]{1}[0-9]{7}\b",
-    
-    # Contact Info
-    "EMAIL": r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
-    "PHONE_INDIA": r"\b(\+91[\-\s]?)?[6789]\d{9}\b",
-    "PHONE_US": r"\b\+?1?[\s\-]?\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{4}\b",
-    
-    # Financial (only credit cards - removed false-positive prone CVV/PIN)
-    "CREDIT_CARD": r"\b[45]\d{3}[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b",
-    
-    # Digital Identifiers
-    "IP_ADDRESS": r"\b(?:25[0-5]|2[0-4]\d|1?\d{1,2})(?:\.(?:25[0-5]|2[0-4]\d|1?\d{1,2})){3}\b",
-    "MAC_ADDRESS": r"\b([0-9A-Fa-f]{2}[:\-]){5}[0-9A-Fa-f]{2}\b",
-    
-    # Dates
-    "DOB": r"\b\d{2}[\-/\.]\d{2}[\-/\.]\d{4}\b"
-}
+# Caps per-request memory: matches, redacted copy and history row all scale
+# with the input size.
+MAX_SCAN_BYTES = settings().max_scan_bytes
 
+# --- Scan History Writer ---
+# Scans enqueue their history row and return immediately; a single writer
+# task flushes up to HISTORY_BATCH_SIZE rows per insert, waiting at most
+# HISTORY_FLUSH_SECONDS for a batch to fill.
+HISTORY_BATCH_SIZE = 64
+HISTORY_FLUSH_SECONDS = 0.05
+HISTORY_QUEUE: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
 
-def detect_and_redact(text: str, custom_patterns: Optional[Dict[str, str]] = None):
-    detected = []
-    
-    all_patterns = PATTERNS.copy()
-    if custom_patterns:
-        all_patterns.update(custom_patterns)
-        
-    for pii_type, pattern in all_patterns.items():
-        try:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                value = match.group()
-                detected.append({
-                    "type": pii_type,
-                    "value": value,
-                    "start": match.start(),
-                    "end": match.end()
-                })
-        except re.error:
-            continue
-    
-    text_list = list(text)
-    for item in detected:
-        for i in range(item['start'], item['end']):
-            text_list[i] = '*'
-    
-    redacted_text = "".join(text_list)
-    return redacted_text, detected
+async def _insert_history(batch: List[Dict[str, Any]]):
+    supabase = await get_supabase()
+    await supabase.table("scan_history").insert(batch).execute()
+
+async def _flush_history(batch: List[Dict[str, Any]]):
+    try:
+        await _insert_history(batch)
+    except Exception:
+        logger.exception("Failed to write %d scan history rows", len(batch))
+
+async def _history_writer():
+    # Runs until it dequeues the None sentinel; every row queued before it,
+    # including a partly filled batch, is flushed first
+    loop = asyncio.get_running_loop()
+    while True:
+        row = await HISTORY_QUEUE.get()
+        if row is None:
+            return
+        batch = [row]
+        deadline = loop.time() + HISTORY_FLUSH_SECONDS
+        stopping = False
+        while len(batch) < HISTORY_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(HISTORY_QUEUE.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                stopping = True
+                break
+            batch.append(row)
+        await _flush_history(batch)
+        if stopping:
+            return
+
+async def _persist_scan(
+    user_id: str, text: str, redacted: str, detected: List[Dict[str, Any]], store_original: bool
+):
+    await HISTORY_QUEUE.put({
+        "user_id": user_id,
+        # Only a digest of the input is kept unless the user opts in
+        "original_text": text if store_original else None,
+        "original_text_sha256": hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        "redacted_text": redacted,
+        "detected_pii": detected
+    })
 
 # --- Auth Routes ---
 
 @app.post("/api/register", response_model=Token)
 async def register(user: UserCreate):
     """Register a new user account."""
+    supabase = await get_supabase()
+    
     # Check if username exists
-    existing = supabase.table("users").select("*").eq("username", user.username).execute()
+    existing = await supabase.table("users").select("*").eq("username", user.username).execute()
     if existing.data:
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Hash password and create user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     
-    result = supabase.table("users").insert({
+    result = await supabase.table("users").insert({
         "username": user.username,
         "email": user.email,
         "hashed_password": hashed_password
@@ -201,6 +317,7 @@ async def register(user: UserCreate):
         raise HTTPException(status_code=500, detail="Failed to create user")
     
     new_user = result.data[0]
+    _USER_ROW_CACHE.pop(user.username, None)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -210,23 +327,35 @@ async def register(user: UserCreate):
     return {"access_token": access_token, "token_type": "bearer", "username": user.username}
 
 @app.post("/api/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends()):
     """Login and receive an access token."""
-    result = supabase.table("users").select("*").eq("username", form_data.username).execute()
+    login_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Incorrect username or password",
+    )
     
-    if not result.data:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-        )
+    login_key = _login_key(form_data.username, form_data.password)
+    if login_key in _BAD_LOGIN_CACHE:
+        raise login_exception
     
-    user = result.data[0]
+    user = _USER_ROW_CACHE.get(form_data.username)
+    if user is None:
+        supabase = await get_supabase()
+        result = await supabase.table("users").select("*").eq("username", form_data.username).execute()
+        if not result.data:
+            # Not cached: the name may be registered a moment later, possibly
+            # on another worker, and this miss never reached bcrypt anyway
+            raise login_exception
+        user = result.data[0]
+        _USER_ROW_CACHE[form_data.username] = user
     
-    if not verify_password(form_data.password, user["hashed_password"]):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-        )
+    if not await verify_password(form_data.password, user["hashed_password"]):
+        _BAD_LOGIN_CACHE[login_key] = True
+        raise login_exception
+    
+    if needs_rehash(user["hashed_password"]):
+        _USER_ROW_CACHE.pop(form_data.username, None)
+        background_tasks.add_task(rehash_password, user["id"], form_data.password)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -243,44 +372,63 @@ async def read_users_me(current_user: dict = Depends(get_current_user)):
 # --- Protected PII Routes ---
 
 @app.post("/api/scan", response_model=PIIResponse)
-async def scan_text(request: PIIRequest, current_user: dict = Depends(get_current_user)):
+async def scan_text(
+    request: PIIRequest,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user),
+):
     """Scan text for PII (requires authentication)."""
+    if len(request.text.encode('utf-8')) > MAX_SCAN_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Text exceeds the {MAX_SCAN_BYTES} byte scan limit",
+        )
+    
     redacted, detected = detect_and_redact(request.text, request.custom_patterns)
     risk_level = calculate_risk(detected)
     
-    # Save to Supabase
-    supabase.table("scan_history").insert({
-        "user_id": current_user["id"],
-        "original_text": request.text,
-        "redacted_text": redacted,
-        "detected_pii_json": json.dumps(detected),
-        "risk_level": risk_level
-    }).execute()
+    # Hashing and queueing the history row happen after the response is sent
+    background_tasks.add_task(
+        _persist_scan, current_user["id"], request.text, redacted, detected, request.store_original
+    )
     
     return PIIResponse(
-        original_text=request.text,
+        original_text=request.text if request.include_original else "",
         redacted_text=redacted,
         detected_pii=detected,
         risk_level=risk_level
     )
 
 @app.get("/api/history")
-async def get_history(current_user: dict = Depends(get_current_user)):
-    """Get scan history for authenticated user."""
-    result = supabase.table("scan_history").select("*").eq(
-        "user_id", current_user["id"]
-    ).order("created_at", desc=True).execute()
-    
-    history = []
-    for entry in result.data:
-        history.append({
-            "id": entry["id"],
-            "redacted_text": entry["redacted_text"],
-            "detected_pii": json.loads(entry["detected_pii_json"]),
-            "risk_level": entry["risk_level"],
-            "timestamp": entry["created_at"]
-        })
-    return history
+async def get_history(
+    current_user: dict = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[datetime] = Query(None, description="created_at of the last scan on the previous page"),
+    cursor_id: Optional[str] = Query(
+        None, pattern=r"^[0-9A-Za-z-]+$", description="id of the last scan on the previous page"
+    ),
+):
+    """Get a page of scan history for authenticated user, newest first."""
+    # Only the columns the response needs, already in response shape
+    # (created_at aliased to timestamp), so rows pass through untouched;
+    # original_text never leaves the DB
+    supabase = await get_supabase()
+    query = supabase.table("scan_history").select(
+        "id,redacted_text,detected_pii,risk_level,timestamp:created_at"
+    ).eq("user_id", current_user["id"])
+    # Rows from one batched insert share created_at, so id breaks ties both
+    # in the sort and in the keyset cursor (index: user_id, created_at, id)
+    if cursor and cursor_id:
+        created_at = cursor.isoformat()
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{cursor_id})'
+        )
+    elif cursor:
+        query = query.lt("created_at", cursor.isoformat())
+    query = query.order("created_at", desc=True).order("id", desc=True)
+    result = await query.range(offset, offset + limit - 1).execute()
+    return result.data
 
 # --- Public Routes ---
 
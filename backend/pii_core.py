@@ -0,0 +1,333 @@
+"""PII detection, redaction and risk scoring.
+
+Pure functions of their inputs with full annotations, so the module can be
+compiled to a C extension with `mypyc pii_core.py` (see README).
+"""
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+try:
+    import hyperscan  # type: ignore[import-not-found, unused-ignore]
+except ImportError:  # Optional: scanning falls back to the `re` engine
+    hyperscan = None  # type: ignore[assignment, unused-ignore]
+
+try:
+    import re2  # type: ignore[import-untyped, unused-ignore]
+except ImportError:  # Optional: linear-time engine for the built-in patterns
+    re2 = None  # type: ignore[assignment, unused-ignore]
+
+# --- Risk Scoring ---
+HIGH_SENSITIVITY = frozenset({"AADHAAR", "PAN", "PASSPORT", "CREDIT_CARD", "CVV", "ATM_PIN"})
+MEDIUM_SENSITIVITY = frozenset({"VOTER_ID", "GSTIN"})
+
+# The scan_history.risk_level generated column applies the same rules in SQL
+def calculate_risk(detected: List[Dict[str, Any]]) -> str:
+    if not detected:
+        return "None"
+    
+    # Single pass: any high-sensitivity hit or a sixth item settles "High"
+    has_medium = False
+    for count, item in enumerate(detected, 1):
+        pii_type = item['type']
+        if pii_type in HIGH_SENSITIVITY or count > 5:
+            return "High"
+        if pii_type in MEDIUM_SENSITIVITY:
+            has_medium = True
+    
+    if has_medium or len(detected) >= 3:
+        return "Medium"
+    return "Low"
+
+# --- Regex Patterns ---
+PATTERNS: Dict[str, str] = {
+    # Financial
+    "CREDIT_CARD": r"\b[45]\d{3}[\s\-]?\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b",
+    # CVV/PIN only next to their keyword, else every short number matches;
+    # the <TYPE>_VALUE group marks the digits to report and redact. Card
+    # PINs are 4 digits; 6 digits after "PIN" is a postal code.
+    "ATM_PIN": r"\b(?i:a?tm[\s_-]*pin|pin)\D{0,8}(?P<ATM_PIN_VALUE>\d{4})\b",
+    "CVV": r"\b(?i:cvv)\D{0,6}(?P<CVV_VALUE>\d{3})\b",
+    
+    # Indian Documents
+    "AADHAAR": r"\b\d{4}[\s\-]?\d{4}[\s\-]?\d{4}\b",
+    "PAN": r"\b[A-Z]{5}[0-9]{4}[A-Z]{1}\b",
+    "VOTER_ID": r"\b[A-Z]{3}[0-9]{7}\b",
+    "GSTIN": r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[1-9A-Z]{1}Z[0-9A-Z]{1}\b",
+    "PASSPORT": r"\b[A-Z]{1}[0-9]{7}\b",
+    
+    # Contact Info
+    "EMAIL": r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b",
+    "PHONE_INDIA": r"\b(\+91[\-\s]?)?[6789]\d{9}\b",
+    "PHONE_US": r"\b(?:\+?1[\s\-]?)?\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{4}\b",
+    
+    # Digital Identifiers
+    "IP_ADDRESS": r"\b(?:25[0-5]|2[0-4]\d|1?\d{1,2})(?:\.(?:25[0-5]|2[0-4]\d|1?\d{1,2})){3}\b",
+    "MAC_ADDRESS": r"\b([0-9A-Fa-f]{2}[:\-]){5}[0-9A-Fa-f]{2}\b",
+    
+    # Dates
+    "DOB": r"\b\d{2}[\-/\.]\d{2}[\-/\.]\d{4}\b"
+}
+
+VALUE_GROUPS: Dict[str, str] = {k: f"{k}_VALUE" for k, v in PATTERNS.items() if f"(?P<{k}_VALUE>" in v}
+
+
+# --- Hyperscan Multi-Pattern Database ---
+def _build_hyperscan_db(patterns: Tuple[str, ...]) -> Any:
+    if hyperscan is None:
+        return None
+    db = hyperscan.Database()
+    try:
+        db.compile(
+            expressions=[p.encode("utf-8") for p in patterns],
+            ids=list(range(len(patterns))),
+            flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(patterns),
+        )
+    except hyperscan.error:
+        # Unsupported PCRE syntax; caller falls back to `re`
+        return None
+    return db
+
+HS_DB = _build_hyperscan_db(tuple(PATTERNS.values()))
+ID_TO_TYPE = list(PATTERNS)
+
+@lru_cache(maxsize=128)
+def _custom_hyperscan_db(items: Tuple[Tuple[str, str], ...]) -> Any:
+    return _build_hyperscan_db(tuple(pattern for _, pattern in items))
+
+def _hyperscan_scan(db: Any, types: List[str], regexes: List[Any], text: str) -> List[Dict[str, Any]]:
+    # Hyperscan's spans are leftmost-longest, while re.finditer's are
+    # leftmost-first (runs of back-to-back emails split differently), and it
+    # has no capture groups. So it only finds which patterns occur and where
+    # each first starts; the compiled pattern re-matches from there.
+    first_start: Dict[int, int] = {}
+
+    def on_match(pattern_id: int, start: int, end: int, flags: int, context: Any) -> None:
+        if start < first_start.get(pattern_id, start + 1):
+            first_start[pattern_id] = start
+
+    db.scan(text.encode("utf-8"), match_event_handler=on_match)
+
+    detected: List[Dict[str, Any]] = []
+    for pattern_id, pos in first_start.items():
+        pii_type, regex = types[pattern_id], regexes[pattern_id]
+        if regex is None:
+            continue  # Custom pattern `re` can't compile; the regex path skips it too
+        group = regex.groupindex.get(VALUE_GROUPS.get(pii_type, ""), 0)
+        for m in regex.finditer(text, pos):
+            detected.append({
+                "type": pii_type,
+                "value": m.group(group),
+                "start": m.start(group),
+                "end": m.end(group)
+            })
+    detected.sort(key=lambda item: item["start"])
+    return detected
+
+# --- Compiled Regex Fallback ---
+# RE2 compiles to a DFA with a fixed memory budget, so untrusted text can't
+# trigger catastrophic backtracking. Disable with USE_RE2=0.
+USE_RE2 = re2 is not None and settings().use_re2
+
+if USE_RE2:
+    RE2_OPTIONS = re2.Options()
+    RE2_OPTIONS.max_mem = 8 << 20
+
+def _compile(pattern: str, flags: int = 0) -> Any:
+    if USE_RE2:
+        try:
+            return re2.compile(pattern, RE2_OPTIONS)
+        except re2.error:
+            pass  # Unsupported syntax (backreferences, lookarounds)
+    return re.compile(pattern, flags)
+
+# One alternation with a named group per type scans the text once; the
+# matching group's name gives the PII type. At each position the first
+# alternative wins, so types whose matches can overlap go in separate
+# families and _claim settles conflicts between them.
+SCAN_FAMILIES: Tuple[Tuple[str, ...], ...] = (
+    # Checksummed types each scan alone: a card number that fails Luhn
+    # must not hide the Aadhaar inside it
+    ("CREDIT_CARD",),
+    ("AADHAAR",),
+    # Phone formats share digit runs, and an email can wrap any of them
+    ("PHONE_INDIA",),
+    ("PHONE_US",),
+    ("EMAIL",),
+    # Word-bounded tokens of distinct shapes: these never overlap
+    ("PAN", "VOTER_ID", "GSTIN", "PASSPORT"),
+    ("IP_ADDRESS", "MAC_ADDRESS", "DOB"),
+    # A keyword-anchored match starts at its keyword, so fused with the rest
+    # it would swallow digits that follow the value (an Aadhaar after "pin")
+    ("ATM_PIN", "CVV"),
+)
+
+def _fuse(types: Tuple[str, ...]) -> str:
+    return "|".join(f"(?P<{k}>{PATTERNS[k]})" for k in types)
+
+FAMILY_RES: List[Any] = [_compile(_fuse(types)) for types in SCAN_FAMILIES]
+
+# Pure-ASCII input (logs, form fields) gives identical matches under
+# re.ASCII, which skips Unicode lookups for \b, \d and \w. This only
+# applies to the `re` fallback (USE_RE2=0 or google-re2 not installed);
+# RE2 classes are ASCII-only already, so its families are reused as-is.
+FAMILY_RES_ASCII: List[Any] = [
+    re.compile(_fuse(types), re.ASCII) if isinstance(regex, re.Pattern) else regex
+    for types, regex in zip(SCAN_FAMILIES, FAMILY_RES)
+]
+
+# Keyed per pattern string so users sharing a rule share its compiled form.
+# RE2 is tried first; patterns it rejects (lookarounds, backreferences) use
+# `re`. Patterns neither accepts are validated here once and cached as None.
+@lru_cache(maxsize=256)
+def _compile_custom(pattern: str) -> Any:
+    try:
+        return _compile(pattern)
+    except re.error:
+        return None
+
+# Group indices rather than names: RE2 match spans only accept integers
+FAMILY_VALUE_INDEX: List[Dict[str, int]] = [
+    {k: regex.groupindex[VALUE_GROUPS[k]] for k in types if k in VALUE_GROUPS}
+    for types, regex in zip(SCAN_FAMILIES, FAMILY_RES)
+]
+
+# Per-pattern regexes that re-match Hyperscan's hits, indexed like HS_DB
+HS_RES: List[Any] = [_compile(PATTERNS[k]) for k in ID_TO_TYPE]
+
+def _mega_scan(text: str) -> List[Dict[str, Any]]:
+    detected: List[Dict[str, Any]] = []
+    regexes = FAMILY_RES_ASCII if text.isascii() else FAMILY_RES
+    for regex, value_index in zip(regexes, FAMILY_VALUE_INDEX):
+        for m in regex.finditer(text):
+            pii_type = m.lastgroup
+            group = value_index.get(pii_type, 0)
+            detected.append({
+                "type": pii_type,
+                "value": m.group(group),
+                "start": m.start(group),
+                "end": m.end(group)
+            })
+    detected.sort(key=lambda item: item["start"])
+    return detected
+
+# Custom rules scan one by one: user patterns can overlap each other (or
+# match empty strings), and a fused alternation would keep only the first
+# alternative at each position. _claim settles overlaps afterwards.
+def _custom_scan(items: Tuple[Tuple[str, str], ...], text: str) -> List[Dict[str, Any]]:
+    compiled = [(pii_type, _compile_custom(pattern)) for pii_type, pattern in items]
+    return _re_scan([(pii_type, regex) for pii_type, regex in compiled if regex is not None], text)
+
+def _re_scan(compiled: List[Tuple[str, Any]], text: str) -> List[Dict[str, Any]]:
+    detected: List[Dict[str, Any]] = []
+    for pii_type, regex in compiled:
+        for match in regex.finditer(text):
+            detected.append({
+                "type": pii_type,
+                "value": match.group(),
+                "start": match.start(),
+                "end": match.end()
+            })
+    return detected
+
+# --- Span Claiming ---
+# When matches overlap, the higher-priority type keeps the span. Types not
+# listed (digital identifiers, custom rules) rank after these, in order.
+CLAIM_PRIORITY: List[str] = [
+    "CREDIT_CARD", "AADHAAR", "PASSPORT", "PAN", "VOTER_ID", "GSTIN",
+    "PHONE_INDIA", "PHONE_US", "EMAIL", "DOB", "ATM_PIN", "CVV",
+]
+_CLAIM_RANK: Dict[str, int] = {pii_type: rank for rank, pii_type in enumerate(CLAIM_PRIORITY)}
+
+def _claim(detected: List[Dict[str, Any]], length: int) -> List[Dict[str, Any]]:
+    # One byte per character of text: marking and probing a span costs its
+    # length, and claimed spans are disjoint, so the pass stays linear
+    mask = bytearray(length)
+    claimed: List[Dict[str, Any]] = []
+    ranked = sorted(detected, key=lambda item: (_CLAIM_RANK.get(item["type"], len(CLAIM_PRIORITY)), item["start"]))
+    for item in ranked:
+        start, end = item["start"], item["end"]
+        if mask.find(1, start, end) != -1:
+            continue
+        mask[start:end] = b"\x01" * (end - start)
+        claimed.append(item)
+    claimed.sort(key=lambda item: item["start"])
+    return claimed
+
+# --- Checksum Validation ---
+# Digit sum of 2*d, indexed by d
+_LUHN_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)
+
+def _luhn(value: str) -> bool:
+    total = 0
+    for i, digit in enumerate(int(c) for c in reversed(value) if c.isdigit()):
+        total += _LUHN_DOUBLED[digit] if i & 1 else digit
+    return total % 10 == 0
+
+# Verhoeff multiplication and permutation tables (Aadhaar check digit)
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6), (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8), (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2), (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4), (9, 8, 7, 6, 5, 4, 3, 2, 1, 0),
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2), (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0), (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5), (7, 0, 4, 6, 9, 1, 3, 2, 5, 8),
+)
+
+def _verhoeff(value: str) -> bool:
+    check = 0
+    for i, digit in enumerate(int(c) for c in reversed(value) if c.isdigit()):
+        check = _VERHOEFF_D[check][_VERHOEFF_P[i % 8][digit]]
+    return check == 0
+
+# Matches of these types are only reported if their check digit is valid
+CHECKSUMS: Dict[str, Callable[[str], bool]] = {"CREDIT_CARD": _luhn, "AADHAAR": _verhoeff}
+
+def _passes_checksum(item: Dict[str, Any]) -> bool:
+    check = CHECKSUMS.get(item["type"])
+    return check is None or check(item["value"])
+
+def _redact(text: str, detected: List[Dict[str, Any]]) -> str:
+    # Merge overlapping spans, then stitch slices together in one pass
+    parts: List[str] = []
+    cursor = 0
+    for start, end in sorted((item["start"], item["end"]) for item in detected):
+        if end <= cursor:
+            continue
+        start = max(start, cursor)
+        parts.append(text[cursor:start])
+        parts.append("*" * (end - start))
+        cursor = end
+    parts.append(text[cursor:])
+    return "".join(parts)
+
+def detect_and_redact(
+    text: str, custom_patterns: Optional[Dict[str, str]] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    # Hyperscan reports byte offsets, so only ASCII text takes the single-pass path
+    use_hyperscan = HS_DB is not None and text.isascii()
+    if use_hyperscan:
+        detected = _hyperscan_scan(HS_DB, ID_TO_TYPE, HS_RES, text)
+    else:
+        detected = _mega_scan(text)
+    detected = [item for item in detected if _passes_checksum(item)]
+
+    if custom_patterns:
+        items = tuple(custom_patterns.items())
+        custom_db = _custom_hyperscan_db(items) if use_hyperscan else None
+        if custom_db is not None:
+            regexes = [_compile_custom(pattern) for _, pattern in items]
+            detected.extend(_hyperscan_scan(custom_db, [k for k, _ in items], regexes, text))
+        else:
+            detected.extend(_custom_scan(items, text))
+    
+    # Report one type per span, but redact every candidate: a lower-ranked
+    # match overhanging the winner (an email around a phone) is still PII
+    return _redact(text, detected), _claim(detected, len(text))
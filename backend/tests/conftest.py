@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app runs from backend/ (`uvicorn main:app`), so modules import flat
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cheap bcrypt for the API tests; read once when settings() is first called
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import bcrypt
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from supabase import AsyncClientOptions, acreate_client
+
+import main
+
+
+class FakeSupabase:
+    """Just enough PostgREST for the users and scan_history tables."""
+
+    def __init__(self):
+        self.users = {}
+        self.history = []
+        self.requests = []
+
+    def handle(self, request):
+        self.requests.append(request)
+        table = request.url.path.rsplit("/", 1)[-1]
+        params = dict(request.url.params)
+        if table == "users" and request.method == "GET":
+            username = params.get("username", "")[len("eq."):]
+            return httpx.Response(200, json=[self.users[username]] if username in self.users else [])
+        if table == "users" and request.method == "POST":
+            row = json.loads(request.content)
+            row["id"] = str(len(self.users) + 1)
+            self.users[row["username"]] = row
+            return httpx.Response(201, json=[row])
+        if table == "users" and request.method == "PATCH":
+            user_id = params["id"][len("eq."):]
+            for row in self.users.values():
+                if row["id"] == user_id:
+                    row.update(json.loads(request.content))
+            return httpx.Response(200, json=[])
+        if table == "scan_history" and request.method == "POST":
+            self.history.extend(json.loads(request.content))
+            return httpx.Response(201, json=[])
+        if table == "scan_history" and request.method == "GET":
+            return httpx.Response(200, json=[{
+                "id": 7, "redacted_text": "PAN **********", "detected_pii": [],
+                "risk_level": "High", "timestamp": "2026-10-15T09:30:00.123456+00:00",
+            }])
+        return httpx.Response(404)
+
+    def count(self, method, table):
+        return sum(1 for r in self.requests if r.method == method and r.url.path.endswith("/" + table))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeSupabase()
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handle))
+    client = asyncio.run(acreate_client(
+        "http://supabase.test", "test-key", options=AsyncClientOptions(httpx_client=http_client)
+    ))
+    monkeypatch.setattr(main, "_supabase", client)
+    # Each TestClient runs its own event loop
+    monkeypatch.setattr(main, "HISTORY_QUEUE", asyncio.Queue())
+    for cache in (main._USER_ROW_CACHE, main._BAD_LOGIN_CACHE, main._TOKEN_CACHE, main._PW_CACHE):
+        cache.clear()
+    return fake
+
+
+@pytest.fixture
+def client(db):
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def _register(client, username="bob", password="pw"):
+    response = client.post("/api/register", json={"username": username, "password": password})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def _login(client, username="bob", password="pw"):
+    return client.post("/api/token", data={"username": username, "password": password})
+
+
+def test_login_succeeds_right_after_registering_a_name_that_failed(client):
+    assert _login(client).status_code == 401
+    _register(client)
+    assert _login(client).status_code == 200
+
+
+def test_repeated_bad_login_skips_database_and_bcrypt(client, db, monkeypatch):
+    _register(client)
+    checks = []
+    checkpw = bcrypt.checkpw
+    monkeypatch.setattr(bcrypt, "checkpw", lambda *args: checks.append(1) or checkpw(*args))
+
+    assert _login(client, password="wrong").status_code == 401
+    lookups = db.count("GET", "users")
+    assert _login(client, password="wrong").status_code == 401
+    assert len(checks) == 1
+    assert db.count("GET", "users") == lookups
+
+
+def test_user_row_is_cached_between_logins(client, db):
+    _register(client)
+    assert _login(client).status_code == 200
+    lookups = db.count("GET", "users")
+    assert _login(client).status_code == 200
+    assert db.count("GET", "users") == lookups
+
+
+def test_bcrypt_sheds_load_with_429(client, monkeypatch):
+    monkeypatch.setattr(main, "BCRYPT_SEMAPHORE", asyncio.Semaphore(0))
+    response = client.post("/api/register", json={"username": "bob", "password": "pw"})
+    assert response.status_code == 429
+
+
+def test_login_rehashes_outdated_hash(client, db):
+    outdated = bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=main.BCRYPT_ROUNDS + 1)).decode()
+    db.users["bob"] = {"id": "1", "username": "bob", "hashed_password": outdated}
+
+    assert _login(client).status_code == 200
+    rehashed = db.users["bob"]["hashed_password"]
+    assert rehashed != outdated
+    assert not main.needs_rehash(rehashed)
+    assert bcrypt.checkpw(b"pw", rehashed.encode())
+
+
+def test_scan_over_size_limit_returns_413(client, monkeypatch):
+    token = _register(client)
+    monkeypatch.setattr(main, "MAX_SCAN_BYTES", 8)
+    response = client.post(
+        "/api/scan", json={"text": "123456789"}, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 413
+
+
+def test_scan_history_is_written_by_shutdown(db):
+    with TestClient(main.app) as client:
+        token = _register(client)
+        response = client.post(
+            "/api/scan", json={"text": "PAN ABCDE1234F"}, headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.json()["redacted_text"] == "PAN **********"
+    assert [row["redacted_text"] for row in db.history] == ["PAN **********"]
+    assert db.history[0]["original_text"] is None
+
+
+def test_cached_token_still_expires(client):
+    token = main.create_access_token({"sub": "bob", "user_id": "1"}, timedelta(seconds=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    time.sleep(2.1)
+    assert client.get("/api/users/me", headers=headers).status_code == 401
+
+
+def test_history_rows_pass_through_in_response_shape(client, db):
+    token = _register(client)
+    response = client.get("/api/history", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()[0]["timestamp"] == "2026-10-15T09:30:00.123456+00:00"
+    params = db.requests[-1].url.params
+    assert params["select"] == "id,redacted_text,detected_pii,risk_level,timestamp:created_at"
+    assert params["order"] == "created_at.desc,id.desc"
+
+
+def test_history_cursor_breaks_created_at_ties_by_id(client, db):
+    token = _register(client)
+    response = client.get(
+        "/api/history",
+        params={"cursor": "2026-10-15T09:30:00.123456+00:00", "cursor_id": "7"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    params = db.requests[-1].url.params
+    assert params["or"] == (
+        '(created_at.lt."2026-10-15T09:30:00.123456+00:00",'
+        'and(created_at.eq."2026-10-15T09:30:00.123456+00:00",id.lt.7))'
+    )
+    assert params["order"] == "created_at.desc,id.desc"
+
+
+def test_history_rejects_malformed_cursor(client):
+    token = _register(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/history", params={"cursor": "yesterday"}, headers=headers).status_code == 422
+    bad_id = {"cursor": "2026-10-15T09:30:00+00:00", "cursor_id": "7),id.gt.(0"}
+    assert client.get("/api/history", params=bad_id, headers=headers).status_code == 422
@@ -0,0 +1,180 @@
+import random
+import re
+import time
+
+import pytest
+
+import pii_core
+from pii_core import PATTERNS, VALUE_GROUPS, _luhn, _mega_scan, _verhoeff, calculate_risk, detect_and_redact
+
+# Texts where several types compete for the same characters
+OVERLAPPING_SAMPLES = [
+    "My number is 9876543210.",
+    "mail 9876543210@gmail.com or ABCDE1234F@corp.in",
+    "pin 2345 6789 0124, cvv 123, ATM PIN 4821",
+    "4000 0000 0005 0000 and card 4111 1111 1111 1111",
+    "call +91 9876543210 or +1 (555) 123-4567",
+    "GSTIN 27ABCDE1234F1Z5 voter ABC1234567 passport A1234567 PAN ABCDE1234F",
+    "ip 192.168.1.1 mac 00:1A:2B:3C:4D:5E dob 01/02/1990 or 12.10.2000",
+    # Leftmost-longest and leftmost-first split these emails differently
+    "x.y@mail.comx.y@mail.coma@b.co",
+]
+
+
+def _spans(detected):
+    return sorted((item["type"], item["start"], item["end"]) for item in detected)
+
+
+def _per_pattern_scan(text):
+    # What Hyperscan reports: each pattern's own non-overlapping hits
+    detected = []
+    for pii_type, pattern in PATTERNS.items():
+        group = VALUE_GROUPS.get(pii_type, 0)
+        for m in re.finditer(pattern, text):
+            detected.append({"type": pii_type, "start": m.start(group), "end": m.end(group)})
+    return detected
+
+
+def test_pin_keyword_does_not_swallow_following_aadhaar():
+    redacted, detected = detect_and_redact("pin 2345 6789 0124")
+    assert redacted == "pin **************"
+    assert [item["type"] for item in detected] == ["AADHAAR"]
+
+
+def test_atm_pin_and_cvv_report_only_the_digits():
+    redacted, detected = detect_and_redact("ATM PIN: 4821, cvv 123")
+    assert redacted == "ATM PIN: ****, cvv ***"
+    assert [(item["type"], item["value"]) for item in detected] == [("ATM_PIN", "4821"), ("CVV", "123")]
+
+
+def test_postal_pin_code_is_not_an_atm_pin():
+    redacted, detected = detect_and_redact("Bengaluru PIN 560001")
+    assert redacted == "Bengaluru PIN 560001"
+    assert detected == []
+    assert calculate_risk(detected) == "None"
+
+
+def test_invalid_custom_patterns_are_skipped():
+    redacted, detected = detect_and_redact("PAN ABCDE1234F", {"x": "[", "y": "("})
+    assert redacted == "PAN **********"
+    assert [item["type"] for item in detected] == ["PAN"]
+
+
+def test_custom_patterns_run_alongside_invalid_ones():
+    redacted, detected = detect_and_redact("id EMP-42", {"bad": "[", "EMP": r"EMP-\d+"})
+    assert redacted == "id ******"
+    assert [item["type"] for item in detected] == ["EMP"]
+
+
+@pytest.mark.parametrize("value", ["79927398713", "4111 1111 1111 1111", "4539578763621486"])
+def test_luhn_accepts_known_valid_numbers(value):
+    assert _luhn(value)
+
+
+@pytest.mark.parametrize("value", ["79927398710", "4111 1111 1111 1112", "4539578763621487"])
+def test_luhn_rejects_known_invalid_numbers(value):
+    assert not _luhn(value)
+
+
+@pytest.mark.parametrize("value", ["2363", "123451", "2345 6789 0124"])
+def test_verhoeff_accepts_known_valid_numbers(value):
+    assert _verhoeff(value)
+
+
+@pytest.mark.parametrize("value", ["2364", "123450", "2345 6789 0125"])
+def test_verhoeff_rejects_known_invalid_numbers(value):
+    assert not _verhoeff(value)
+
+
+def test_checksums_accept_exactly_one_check_digit():
+    assert sum(_luhn(f"7992739871{d}") for d in range(10)) == 1
+    assert sum(_verhoeff(f"2345 6789 012{d}") for d in range(10)) == 1
+
+
+def test_card_failing_luhn_still_yields_its_aadhaar():
+    redacted, detected = detect_and_redact("4000 0000 0005 0000")
+    assert redacted == "************** 0000"
+    assert [(item["type"], item["value"]) for item in detected] == [("AADHAAR", "4000 0000 0005")]
+
+
+def test_valid_card_outranks_the_aadhaar_inside_it():
+    redacted, detected = detect_and_redact("card 4111 1111 1111 1111")
+    assert redacted == "card *******************"
+    assert [item["type"] for item in detected] == ["CREDIT_CARD"]
+
+
+def test_indian_mobile_is_not_reported_as_us_phone():
+    redacted, detected = detect_and_redact("My number is 9876543210.")
+    assert redacted == "My number is **********."
+    assert [(item["type"], item["value"]) for item in detected] == [("PHONE_INDIA", "9876543210")]
+
+
+def test_overhanging_candidates_are_still_redacted():
+    redacted, detected = detect_and_redact("9876543210@gmail.com")
+    assert redacted == "*" * 20
+    assert [item["type"] for item in detected] == ["PHONE_INDIA"]
+
+
+@pytest.mark.parametrize("text", OVERLAPPING_SAMPLES)
+def test_fused_scan_matches_per_pattern_scan(text):
+    assert _spans(_mega_scan(text)) == _spans(_per_pattern_scan(text))
+
+
+@pytest.mark.parametrize("text", OVERLAPPING_SAMPLES)
+def test_hyperscan_and_regex_paths_agree(text):
+    if pii_core.HS_DB is None:
+        pytest.skip("hyperscan not installed")
+    detected = pii_core._hyperscan_scan(pii_core.HS_DB, pii_core.ID_TO_TYPE, pii_core.HS_RES, text)
+    assert _spans(detected) == _spans(_mega_scan(text))
+
+
+def _interleaved_candidates(n):
+    # PASSPORT ranks first, so every PAN is claimed between two claimed spans
+    detected = []
+    for i in range(n):
+        detected.append({"type": "PASSPORT", "start": i * 20 + 11, "end": i * 20 + 19})
+        detected.append({"type": "PAN", "start": i * 20, "end": i * 20 + 10})
+    return detected, n * 20
+
+
+def _best_claim_time(n):
+    detected, length = _interleaved_candidates(n)
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        pii_core._claim(detected, length)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def test_claim_scales_linearly():
+    small, large = _best_claim_time(10_000), _best_claim_time(80_000)
+    # 8x the candidates: linear is ~8x, quadratic ~64x
+    assert large < small * 24
+
+
+def test_overlapping_custom_rules_are_all_redacted():
+    redacted, detected = detect_and_redact("emp EMP-42-XY", {"EMP_ID": r"EMP-\d+", "EMP_CODE": r"EMP-\d+-[A-Z]+"})
+    assert redacted == "emp *********"
+    assert [item["value"] for item in detected] == ["EMP-42"]
+
+
+def test_empty_matching_custom_rule_does_not_shadow_others():
+    redacted, detected = detect_and_redact("say foo", {"A": r"x*", "B": "foo"})
+    assert redacted == "say ***"
+    assert "B" in [item["type"] for item in detected]
+
+
+def _fuzz_text(rng):
+    pieces = ["x.y", "@", "mail", ".com", ".co", "a", "9876543210", "4111", " ", "-", ".", "ABCDE", "1234", "F", "pin "]
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(1, 12)))
+
+
+def test_hyperscan_and_regex_paths_agree_on_fuzzed_text():
+    if pii_core.HS_DB is None:
+        pytest.skip("hyperscan not installed")
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = _fuzz_text(rng)
+        detected = pii_core._hyperscan_scan(pii_core.HS_DB, pii_core.ID_TO_TYPE, pii_core.HS_RES, text)
+        assert _spans(detected) == _spans(_mega_scan(text)), text
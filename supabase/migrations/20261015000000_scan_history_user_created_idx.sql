@@ -0,0 +1,4 @@
+-- /api/history filters by user and orders newest first; serve it from an
+-- index instead of a sort over the user's rows.
+create index if not exists ix_scan_history_user_created
+    on public.scan_history (user_id, created_at desc);
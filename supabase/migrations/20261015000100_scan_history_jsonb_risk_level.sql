@@ -0,0 +1,25 @@
+-- Store detected PII as native JSONB and derive risk_level from it in the
+-- database. The CASE below mirrors calculate_risk() in backend/pii_core.py;
+-- keep the two in sync.
+alter table public.scan_history
+    alter column detected_pii_json type jsonb using detected_pii_json::jsonb;
+alter table public.scan_history
+    rename column detected_pii_json to detected_pii;
+
+alter table public.scan_history drop column risk_level;
+alter table public.scan_history
+    add column risk_level text generated always as (
+        case
+            when jsonb_array_length(detected_pii) = 0 then 'None'
+            when jsonb_array_length(detected_pii) > 5
+                or jsonb_path_exists(detected_pii, '$[*] ? (@.type == "AADHAAR" || @.type == "PAN" || @.type == "PASSPORT" || @.type == "CREDIT_CARD" || @.type == "CVV" || @.type == "ATM_PIN")')
+                then 'High'
+            when jsonb_array_length(detected_pii) >= 3
+                or jsonb_path_exists(detected_pii, '$[*] ? (@.type == "VOTER_ID" || @.type == "GSTIN")')
+                then 'Medium'
+            else 'Low'
+        end
+    ) stored;
+
+create index if not exists ix_scan_history_detected_pii
+    on public.scan_history using gin (detected_pii);
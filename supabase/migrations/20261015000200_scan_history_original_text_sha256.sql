@@ -0,0 +1,6 @@
+-- Raw scan input is only stored when the user opts in; every row keeps a
+-- SHA-256 digest of it instead.
+alter table public.scan_history
+    add column if not exists original_text_sha256 varchar(64);
+alter table public.scan_history
+    alter column original_text drop not null;
@@ -0,0 +1,6 @@
+-- /api/history orders by (created_at desc, id desc) and seeks on that pair,
+-- since rows from one batched insert share created_at. Extend the index so
+-- the tie-breaker is served from it too.
+create index if not exists ix_scan_history_user_created_id
+    on public.scan_history (user_id, created_at desc, id desc);
+drop index if exists public.ix_scan_history_user_created;